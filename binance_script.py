@@ -1,29 +1,117 @@
 import os
+import atexit
+import base64
+import dbm
 import time
 import logging
+import queue
 import requests
-import gspread
 import hmac
 import hashlib
-from functools import wraps, lru_cache
-from cryptography.fernet import Fernet
+import operator
+import random
+import shelve
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
+from functools import wraps
+from logging.handlers import QueueHandler, QueueListener
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cryptography.fernet import InvalidToken
+from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from google.auth.transport.requests import AuthorizedSession
 from google.oauth2.service_account import Credentials
 
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib parser
+    import json as orjson
+
 # Logging setup
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[logging.StreamHandler()]
-)
+# Workers only enqueue records; a listener thread formats and writes them
+log_queue = queue.Queue(-1)
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+logging.getLogger().addHandler(QueueHandler(log_queue))
+logging.getLogger().setLevel(logging.INFO)
+LOG_LISTENER = QueueListener(log_queue, log_handler)
+LOG_LISTENER.start()
+atexit.register(LOG_LISTENER.stop)  # Flush queued records on exit
 
 # Configuration
 BASE_URL = "https://api.binance.com"
 FUTURES_URL = "https://fapi.binance.com"
+SHEETS_URL = "https://sheets.googleapis.com/v4/spreadsheets"
+MAX_API_RETRIES = 2
+INITIAL_RETRY_DELAY = 2
+BACKOFF_FACTOR = 2
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", "8"))
+PRICE_CACHE_TTL = 30
+PRICE_RETRY_COOLDOWN = 15
+# Binance request weight: hard per-minute caps, the budgets we pace to, and per-endpoint costs.
+# Budget plus the limiter's 5s burst stays under WEIGHT_BACKOFF_RATIO of the cap (960 / 1920),
+# so the token bucket sets the pace and check_weight only catches weight used by other clients
+SPOT_WEIGHT_LIMIT = 1200
+FUTURES_WEIGHT_LIMIT = 2400
+WEIGHT_BACKOFF_RATIO = 0.8
+SPOT_WEIGHT_BUDGET = 880
+FUTURES_WEIGHT_BUDGET = 1760
+TICKER_PRICE_WEIGHT = 4
+SPOT_ACCOUNT_WEIGHT = 20
+FUTURES_ACCOUNT_WEIGHT = 5
+# Fixed part of each signed query; only the timestamp is appended per call
+SPOT_ACCOUNT_QUERY = "omitZeroBalances=true&timestamp="
+FUTURES_ACCOUNT_QUERY = "timestamp="
+NON_RETRIABLE_STATUS = (400, 401, 403, 404, 422)
+RETRIABLE_STATUS = (429, 500, 502, 503, 504)
+BALANCE_CACHE_PATH = os.path.expanduser("~/.wallet_cache.db")
+BALANCE_CACHE_TTL = float(os.getenv("BALANCE_CACHE_TTL", "60"))
+
+# Bound formatters so the format spec is parsed once
+_fmt = "${:,.2f}".format
+_btc_fmt = "{:.8f}".format
+
+# (keyed HMAC template, AES key) derived from ENCRYPTION_KEY, set once by load_cipher()
+CIPHER_KEYS = None
+
+def load_cipher(key):
+    """Split the Fernet key into a pre-keyed HMAC for verification and the AES key"""
+    global CIPHER_KEYS
+    raw = base64.urlsafe_b64decode(key)
+    CIPHER_KEYS = hmac.new(raw[:16], digestmod="sha256"), raw[16:]
+
+def decrypt(encrypted_text):
+    """Decrypt a Fernet token by verifying its HMAC and AES-CBC decrypting the payload"""
+    token_hmac, encryption_key = CIPHER_KEYS
+    try:
+        # Token layout: version (1) | timestamp (8) | IV (16) | ciphertext | HMAC (32)
+        data = base64.urlsafe_b64decode(encrypted_text)
+        if len(data) < 73 or data[0] != 0x80:
+            raise InvalidToken
+        mac = token_hmac.copy()
+        mac.update(data[:-32])
+        if not hmac.compare_digest(mac.digest(), data[-32:]):
+            raise InvalidToken
+        decryptor = Cipher(algorithms.AES(encryption_key), modes.CBC(data[9:25])).decryptor()
+        padded = decryptor.update(data[25:-32]) + decryptor.finalize()
+        unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
+        return (unpadder.update(padded) + unpadder.finalize()).decode()
+    except ValueError:
+        raise InvalidToken
 
-def decrypt(encrypted_text, key):
-    """Decrypt encrypted text using Fernet symmetric encryption"""
-    cipher = Fernet(key)
-    return cipher.decrypt(encrypted_text.encode()).decode()
+def create_session(proxies=None):
+    """Create a pooled HTTP session so requests reuse keep-alive connections"""
+    session = requests.Session()
+    # urllib3 only retries failed connects, quickly; statuses and read errors are left
+    # to retry_api, which signs a fresh query and goes through the rate limiter again
+    retries = Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.5)
+    # Every worker may hold a spot and a futures connection at once
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS * 2, max_retries=retries)
+    session.mount("https://", adapter)
+    session.proxies = proxies or {}
+    return session
 
 def validate_environment():
     """Validate all required environment variables"""
@@ -42,124 +130,333 @@ def validate_environment():
             f"Credentials file not found at {os.getenv('GCP_CREDENTIALS_PATH')}"
         )
 
-def retry_api():
-    """Retry decorator - retries once after 2 seconds on failure"""
+def retry_delay(error, default):
+    """Return seconds to wait before retrying, or None if the error is not retriable"""
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    if status in NON_RETRIABLE_STATUS:
+        return None
+    if status in RETRIABLE_STATUS:
+        retry_after = response.headers.get("Retry-After")
+        try:
+            return float(retry_after)
+        except (TypeError, ValueError):
+            pass  # Missing or HTTP-date form, fall back to backoff
+    return default
+
+def retry_api(max_retries=MAX_API_RETRIES, initial_delay=INITIAL_RETRY_DELAY):
+    """Retry decorator - jittered exponential backoff, or the server's Retry-After"""
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            try:
-                return func(*args, **kwargs)
-            except (requests.exceptions.RequestException, 
-                   gspread.exceptions.APIError) as e:
-                logging.warning(f"Retry in 2s for {func.__name__}")
-                time.sleep(2)
+            for attempt in range(max_retries + 1):
                 try:
                     return func(*args, **kwargs)
-                except Exception as retry_error:
-                    logging.error(f"Retry failed for {func.__name__}")
-                    raise retry_error
+                except requests.exceptions.RequestException as e:
+                    backoff = initial_delay * (BACKOFF_FACTOR ** attempt) * random.uniform(0.8, 1.2)
+                    delay = retry_delay(e, backoff)
+                    if delay is None:
+                        raise
+                    if attempt == max_retries:
+                        logging.error(f"Retry failed for {func.__name__}")
+                        raise
+                    logging.warning(f"Retry in {delay:.1f}s for {func.__name__}")
+                    time.sleep(delay)
         return wrapper
     return decorator
 
+class RateLimiter:
+    """Token bucket of request weight shared by all worker threads, refilled by a timer thread"""
+    def __init__(self, per_minute, burst_seconds=5):
+        self._interval = 60.0 / per_minute
+        self._tokens = threading.BoundedSemaphore(int(per_minute * burst_seconds / 60))
+        self._resume_at = 0.0
+        self._lock = threading.Lock()
+        self._acquire_lock = threading.Lock()
+        threading.Thread(target=self._refill, daemon=True).start()
+
+    def _refill(self):
+        while True:
+            time.sleep(self._interval)
+            try:
+                self._tokens.release()
+            except ValueError:
+                pass  # Bucket is already full
+
+    def pause(self, seconds):
+        """Hold back every caller until the given delay has passed"""
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.time() + seconds)
+
+    def acquire(self, weight=1):
+        """Block until the bucket holds enough weight for the request"""
+        # Callers take their whole weight in turn so partial grabs can't interleave
+        with self._acquire_lock:
+            for _ in range(weight):
+                self._tokens.acquire()
+        delay = self._resume_at - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+SPOT_LIMITER = RateLimiter(SPOT_WEIGHT_BUDGET)
+FUTURES_LIMITER = RateLimiter(FUTURES_WEIGHT_BUDGET)
+
+def check_weight(response, limit, limiter):
+    """Pause the host's workers until the next minute once most of the request weight is used"""
+    used = int(response.headers.get("X-MBX-USED-WEIGHT-1M", 0))
+    if used > limit * WEIGHT_BACKOFF_RATIO:
+        wait = 60 - time.time() % 60
+        logging.warning(f"Request weight {used}/{limit} used, pausing for {wait:.1f}s")
+        limiter.pause(wait)
+
+class PriceCache:
+    """Ticker price snapshot shared by every BinanceAPI instance in the process"""
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._prices = {}
+        self._fetched_at = 0.0
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    @retry_api()
+    def _refresh(self, session):
+        """Fetch every ticker price in a single request"""
+        SPOT_LIMITER.acquire(TICKER_PRICE_WEIGHT)
+        response = session.get(
+            f"{BASE_URL}/api/v3/ticker/price",
+            timeout=5
+        )
+        check_weight(response, SPOT_WEIGHT_LIMIT, SPOT_LIMITER)
+        response.raise_for_status()
+        # Only USDT pairs are used, keyed by base asset so lookups skip building the symbol
+        self._prices = {
+            t["symbol"][:-4]: float(t["price"])
+            for t in orjson.loads(response.content)
+            if t["symbol"].endswith("USDT")
+        }
+
+    def ensure_fresh(self, session):
+        """Refresh the snapshot if it is stale; only one thread fetches, the rest reuse it"""
+        with self._lock:
+            if time.time() - self._fetched_at <= self.ttl:
+                return
+            # After a failed refresh, callers reuse the old snapshot (or fail fast without
+            # one) until the cooldown passes, rather than each running a retry cycle
+            if time.time() < self._retry_at:
+                if not self._prices:
+                    raise RuntimeError("No ticker prices available, refresh is cooling down")
+                return
+            try:
+                self._refresh(session)
+            except Exception as e:
+                self._retry_at = time.time() + PRICE_RETRY_COOLDOWN
+                # Without any snapshot every asset would be priced at 0, so fail the caller;
+                # not a RequestException, so the caller's own retry_api doesn't refetch it
+                if not self._prices:
+                    raise RuntimeError(f"No ticker prices available: {e}") from e
+                logging.warning("Ticker price fetch failed, using cached prices")
+            else:
+                self._fetched_at = time.time()
+
+    def get(self, asset, session):
+        """Return the USDT price of an asset, refreshing the snapshot once it is stale"""
+        if asset == "USDT":
+            return 1.0
+        self.ensure_fresh(session)
+        price = self._prices.get(asset)
+        if price is None:
+            logging.warning(f"Price fetch failed for {asset}, using 0")
+            return 0.0
+        return price
+
+PRICES = PriceCache(PRICE_CACHE_TTL)
+
+class BalanceCache:
+    """On-disk cache of balance results that survives between runs; a ttl of 0 disables it"""
+    def __init__(self, path, ttl):
+        self.ttl = ttl
+        self._db = None
+        self._lock = threading.Lock()
+        if ttl > 0:
+            try:
+                self._db = shelve.open(path)
+            except (OSError, *dbm.error) as e:
+                # The cache only saves calls between runs, so carry on without it
+                logging.warning(f"Balance cache unavailable, continuing without it: {e}")
+
+    @staticmethod
+    def make_key(api_key, endpoint):
+        """Build a cache key that never contains the raw API key"""
+        return f"{hashlib.sha256(api_key.encode()).hexdigest()[:16]}:{endpoint}"
+
+    def get(self, key):
+        """Return the cached value if it is still fresh, otherwise None; expired entries are dropped"""
+        with self._lock:
+            try:
+                entry = self._db.get(key)
+                if entry is None:
+                    return None
+                if time.time() - entry[0] < self.ttl:
+                    return entry[1]
+                del self._db[key]
+            except Exception as e:  # e.g. a truncated entry that no longer unpickles
+                logging.warning(f"Balance cache read failed for {key}: {e}")
+        return None
+
+    def set(self, key, value):
+        with self._lock:
+            try:
+                self._db[key] = (time.time(), value)
+            except Exception as e:
+                logging.warning(f"Balance cache write failed for {key}: {e}")
+
+    def fetch(self, key, func, *args):
+        """Return the cached value for key while it is fresh, otherwise call func and cache its result"""
+        if self._db is None:
+            return func(*args)
+        value = self.get(key)
+        if value is None:
+            value = func(*args)
+            self.set(key, value)
+        return value
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+
 class BinanceAPI:
-    def __init__(self, api_key, api_secret, proxies=None):
+    def __init__(self, api_key, api_secret, session):
         self.api_key = api_key
-        self.api_secret = api_secret
-        self.proxies = proxies or {}
-        self.last_call = 0
-
-    def _rate_limit(self):
-        elapsed = time.time() - self.last_call
-        if elapsed < 0.1:
-            time.sleep(0.1 - elapsed)
-        self.last_call = time.time()
+        self._hmac_template = hmac.new(api_secret.encode(), digestmod="sha256")
+        # Shared by every row, so the API key header is sent per request
+        self.session = session
 
     def _create_signature(self, query_string):
         """Create HMAC SHA256 signature for Binance API"""
-        return hmac.new(
-            self.api_secret.encode(),
-            query_string.encode(),
-            hashlib.sha256
-        ).hexdigest()
+        mac = self._hmac_template.copy()
+        mac.update(query_string.encode())
+        return mac.hexdigest()
+
+    def _signed_query(self, prefix):
+        """Append the current timestamp to a query prefix and sign it"""
+        query_string = f"{prefix}{int(time.time() * 1000)}"
+        return f"{query_string}&signature={self._create_signature(query_string)}"
 
     def _get_headers(self):
         """Return headers with API key for Binance requests"""
         return {"X-MBX-APIKEY": self.api_key}
 
-    @lru_cache(maxsize=32)
-    def _get_price(self, asset):
-        if asset == "USDT":
-            return 1.0
-        try:
-            self._rate_limit()
-            response = requests.get(
-                f"{BASE_URL}/api/v3/ticker/price",
-                params={"symbol": f"{asset}USDT"},
-                proxies=self.proxies,
-                timeout=5
-            )
-            response.raise_for_status()
-            return float(response.json()["price"])
-        except Exception:
-            logging.warning(f"Price fetch failed for {asset}, using 0")
-            return 0.0
+    def _price(self, asset):
+        return PRICES.get(asset, self.session)
 
     @retry_api()
     def get_spot_balances(self):
         """Fetch spot account balances from Binance"""
-        timestamp = str(int(time.time() * 1000))
-        query_string = f"timestamp={timestamp}"
-        signature = self._create_signature(query_string)
-
-        response = requests.get(
+        SPOT_LIMITER.acquire(SPOT_ACCOUNT_WEIGHT)
+        response = self.session.get(
             f"{BASE_URL}/api/v3/account",
-            params=f"{query_string}&signature={signature}",
+            # Let the server drop the hundreds of empty asset entries
+            params=self._signed_query(SPOT_ACCOUNT_QUERY),
             headers=self._get_headers(),
-            proxies=self.proxies,
             timeout=10
         )
+        check_weight(response, SPOT_WEIGHT_LIMIT, SPOT_LIMITER)
         response.raise_for_status()
         
-        account_data = response.json()
-        balances = {b["asset"]: float(b["free"]) for b in account_data["balances"] if float(b["free"]) > 0}
+        account_data = orjson.loads(response.content)
+        # Entries with only locked funds are still returned, so keep the free > 0 filter
+        balances = {b["asset"]: free for b in account_data["balances"] if (free := float(b["free"])) > 0}
         
         # Calculate total USD value and get BTC amount
-        total = 0.0
         btc_amount = balances.get("BTC", 0.0)
-        
-        for asset, amount in balances.items():
-            total += amount * self._get_price(asset)
+        total = sum(map(operator.mul, balances.values(), map(self._price, balances)))
         return total, btc_amount
 
     @retry_api()
     def get_futures_equity(self):
         """Fetch futures account equity from Binance (includes unrealized PnL)"""
-        timestamp = str(int(time.time() * 1000))
-        query_string = f"timestamp={timestamp}"
-        signature = self._create_signature(query_string)
-
-        response = requests.get(
+        FUTURES_LIMITER.acquire(FUTURES_ACCOUNT_WEIGHT)
+        response = self.session.get(
             f"{FUTURES_URL}/fapi/v2/account",
-            params=f"{query_string}&signature={signature}",
+            params=self._signed_query(FUTURES_ACCOUNT_QUERY),
             headers=self._get_headers(),
-            proxies=self.proxies,
             timeout=10
         )
+        check_weight(response, FUTURES_WEIGHT_LIMIT, FUTURES_LIMITER)
         response.raise_for_status()
         
-        account_data = response.json()
+        account_data = orjson.loads(response.content)
         # This includes unrealized PnL (totalCrossUnPnl)
         return float(account_data["totalWalletBalance"]) + float(account_data["totalCrossUnPnl"])
 
+def sheet_range(sheet_name, a1_range):
+    """Qualify an A1 range with its worksheet name"""
+    return "'{}'!{}".format(sheet_name.replace("'", "''"), a1_range)
+
+@retry_api()
+def read_ranges(sheets, sheet_id, ranges):
+    """Read several ranges in one values.batchGet call"""
+    response = sheets.get(
+        f"{SHEETS_URL}/{sheet_id}/values:batchGet",
+        params={"ranges": ranges, "valueRenderOption": "UNFORMATTED_VALUE"},
+        timeout=30
+    )
+    response.raise_for_status()
+    return [value_range.get("values", []) for value_range in orjson.loads(response.content)["valueRanges"]]
+
 @retry_api()
-def update_sheet(sheet, row_index, total_value, btc_amount):
-    sheet.batch_update([{
-        'range': f"A{row_index}",
-        'values': [[total_value]]
-    }, {
-        'range': f"E{row_index}",
-        'values': [[btc_amount]]
-    }])
+def update_sheet(sheets, sheet_id, updates):
+    """Write every processed row back in one values.batchUpdate call"""
+    response = sheets.post(
+        f"{SHEETS_URL}/{sheet_id}/values:batchUpdate",
+        json={"valueInputOption": "RAW", "data": updates},
+        timeout=30
+    )
+    response.raise_for_status()
+
+def decrypt_credentials(row_index, row):
+    """Decrypt a row's API key and secret, returning None if they are unusable"""
+    try:
+        return decrypt(row[1]), decrypt(row[2])
+    except Exception as e:
+        logging.error(f"Row {row_index} failed to initialize or decrypt: {e}")
+        return None
+
+def process_row(row_index, api_key, api_secret, session, cache, futures_executor):
+    """Fetch spot and futures balances for one row, returning None on failure"""
+    spot_total = 0.0
+    btc_amount = 0.0
+    futures = 0.0
+
+    try:
+        api = BinanceAPI(api_key, api_secret, session)
+
+        # Spot and futures live on different hosts, so futures is fetched on the
+        # shared pool while this thread fetches spot
+        futures_job = futures_executor.submit(
+            cache.fetch, BalanceCache.make_key(api_key, "futures"), api.get_futures_equity
+        )
+
+        try:
+            spot_total, btc_amount = cache.fetch(BalanceCache.make_key(api_key, "spot"), api.get_spot_balances)
+        except Exception as e:
+            logging.warning(f"Row {row_index} - Spot balance fetch failed: {e}")
+
+        try:
+            futures = futures_job.result()
+        except Exception as e:
+            logging.warning(f"Row {row_index} - Futures equity fetch failed: {e}")
+
+        total_value = spot_total + futures
+        logging.info(
+            f"Processed row {row_index}: "
+            f"{_fmt(total_value)} (Spot: {_fmt(spot_total)}, Futures: {_fmt(futures)}, BTC: {_btc_fmt(btc_amount)})"
+        )
+        return row_index, total_value, btc_amount
+
+    except Exception as e:
+        logging.error(f"Row {row_index} failed: {e}")
 
 def main():
     try:
@@ -175,48 +472,69 @@ def main():
             scopes=SCOPES
         )
         
-        # Authorize gspread with new credentials
-        sheet = gspread.authorize(creds).open_by_key(
-            os.getenv("SHEET_ID")
-        ).worksheet(os.getenv("SHEET_NAME", "Sheet1"))
+        # Talk to the Sheets REST API directly; ranges are addressed by
+        # worksheet name, so the spreadsheet metadata is never fetched
+        sheets = AuthorizedSession(creds)
+        sheet_id = os.getenv("SHEET_ID")
+        sheet_name = os.getenv("SHEET_NAME", "Sheet1")
 
         # Process rows
-        dec_key = os.getenv("ENCRYPTION_KEY").encode()
-        rows = sheet.get_all_values()
+        load_cipher(os.getenv("ENCRYPTION_KEY").encode())
+        proxies = {"http": os.getenv("PROXY_HTTP"), "https": os.getenv("PROXY_HTTPS")}
 
-        for row_index, row in enumerate(rows[1:], start=2):
-            spot_total = 0.0
-            btc_amount = 0.0
-            futures = 0.0
+        results = {}
+        # One pooled session is shared by all workers so connections are reused across rows
+        with create_session(proxies) as session, \
+                closing(BalanceCache(BALANCE_CACHE_PATH, BALANCE_CACHE_TTL)) as cache, \
+                ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor, \
+                ThreadPoolExecutor(max_workers=MAX_WORKERS) as futures_executor:
+            # Warm the shared ticker snapshot while the sheet is being read
+            prefetch = executor.submit(PRICES.ensure_fresh, session)
 
-            try:
-                api = BinanceAPI(
-                    decrypt(row[1], dec_key),
-                    decrypt(row[2], dec_key),
-                    {"http": os.getenv("PROXY_HTTP"), "https": os.getenv("PROXY_HTTPS")}
-                )
-
-                try:
-                    spot_total, btc_amount = api.get_spot_balances()
-                except Exception as e:
-                    logging.warning(f"Row {row_index} - Spot balance fetch failed: {e}")
+            # Only columns A-C are read; credentials live in B and C
+            rows, = read_ranges(sheets, sheet_id, [sheet_range(sheet_name, "A1:C")])
 
-                try:
-                    futures = api.get_futures_equity()
-                except Exception as e:
-                    logging.warning(f"Row {row_index} - Futures equity fetch failed: {e}")
+            try:
+                prefetch.result()
+            except Exception as e:
+                logging.warning(f"Ticker price prefetch failed, rows will fetch it again: {e}")
 
-                total_value = spot_total + futures
-                update_sheet(sheet, row_index, total_value, btc_amount)
+            # Rows repeating the same credentials are fetched once and the
+            # result is copied to each of them
+            groups = {}
+            for row_index, row in enumerate(rows[1:], start=2):
+                groups.setdefault(tuple(row[1:3]), []).append(row_index)
+            if len(groups) < len(rows) - 1:
+                logging.info(f"{len(rows) - 1 - len(groups)} duplicate rows will reuse earlier results")
 
-                logging.info(
-                    f"Processed row {row_index}: "
-                    f"${total_value:,.2f} (Spot: ${spot_total:,.2f}, Futures: ${futures:,.2f}, BTC: {btc_amount:.8f})"
-                )
-                time.sleep(1)  # Row processing delay
+            # Decrypt every unique account up front so the workers only wait on the network
+            accounts = [
+                (row_indices, decrypt_credentials(row_indices[0], rows[row_indices[0] - 1]))
+                for row_indices in groups.values()
+            ]
+            jobs = {
+                executor.submit(process_row, row_indices[0], *keys, session, cache, futures_executor): row_indices
+                for row_indices, keys in accounts
+                if keys is not None
+            }
+            for job in as_completed(jobs):
+                result = job.result()
+                if result is None:
+                    continue
+                _, total_value, btc_amount = result
+                for row_index in jobs[job]:
+                    results[row_index] = (total_value, btc_amount)
 
-            except Exception as e:
-                logging.error(f"Row {row_index} failed to initialize or decrypt: {e}")
+        if results:
+            # One contiguous range per column; None cells are skipped by the Sheets API,
+            # so failed rows keep their previous values
+            last_row = max(results)
+            row_values = [results.get(i, (None, None)) for i in range(2, last_row + 1)]
+            update_sheet(sheets, sheet_id, [
+                {'range': sheet_range(sheet_name, f"A2:A{last_row}"), 'values': [[total] for total, _ in row_values]},
+                {'range': sheet_range(sheet_name, f"E2:E{last_row}"), 'values': [[btc] for _, btc in row_values]}
+            ])
+            logging.info(f"Updated {len(results)} rows in one batch")
 
     except Exception as e:
         logging.error(f"Script failed: {str(e)}")
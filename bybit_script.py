@@ -1,30 +1,105 @@
 import os
+import atexit
+import base64
+import dbm
 import time
 import json
 import logging
+import queue
 import random
 import requests
-import gspread
 import hmac
 import hashlib
+import operator
+import shelve
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
 from functools import wraps
-from cryptography.fernet import Fernet
+from logging.handlers import QueueHandler, QueueListener
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cryptography.fernet import InvalidToken
+from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from google.auth.transport.requests import AuthorizedSession
 from google.oauth2.service_account import Credentials
 
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib parser
+    import json as orjson
+
 # Logging setup - only INFO level messages and above
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Workers only enqueue records; a listener thread formats and writes them
+log_queue = queue.Queue(-1)
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+logging.getLogger().addHandler(QueueHandler(log_queue))
+logging.getLogger().setLevel(logging.INFO)
+LOG_LISTENER = QueueListener(log_queue, log_handler)
+LOG_LISTENER.start()
+atexit.register(LOG_LISTENER.stop)  # Flush queued records on exit
 
 # Configuration
 BASE_URL = "https://api.bybit.com"
+SHEETS_URL = "https://sheets.googleapis.com/v4/spreadsheets"
 MAX_API_RETRIES = 3
 INITIAL_RETRY_DELAY = 5
 BACKOFF_FACTOR = 2
 RECV_WINDOW = "5000"
+NON_RETRIABLE_STATUS = (400, 401, 403, 404, 422)
+RETRIABLE_STATUS = (429, 500, 502, 503, 504)
+# Signed query keys in the alphabetical order Bybit expects
+SIGNED_PARAM_ORDER = ("accountType", "api_key", "coin", "memberId", "recv_window", "timestamp")
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", "8"))
+RATE_LIMIT_PER_SEC = 5
+BALANCE_CACHE_PATH = os.path.expanduser("~/.wallet_cache.db")
+BALANCE_CACHE_TTL = float(os.getenv("BALANCE_CACHE_TTL", "60"))
+COIN_LIST_CACHE_PATH = os.path.expanduser("~/.wallet_coinlist.json")
+COIN_LIST_CACHE_TTL = 300
+
+# Bound formatter so the format spec is parsed once
+_fmt = "${:,.2f}".format
 
-def decrypt(encrypted_text, key):
-    """Decrypt encrypted text using Fernet symmetric encryption"""
-    cipher = Fernet(key)
-    return cipher.decrypt(encrypted_text.encode()).decode()
+# (keyed HMAC template, AES key) derived from ENCRYPTION_KEY, set once by load_cipher()
+CIPHER_KEYS = None
+
+def load_cipher(key):
+    """Split the Fernet key into a pre-keyed HMAC for verification and the AES key"""
+    global CIPHER_KEYS
+    raw = base64.urlsafe_b64decode(key)
+    CIPHER_KEYS = hmac.new(raw[:16], digestmod="sha256"), raw[16:]
+
+def decrypt(encrypted_text):
+    """Decrypt a Fernet token by verifying its HMAC and AES-CBC decrypting the payload"""
+    token_hmac, encryption_key = CIPHER_KEYS
+    try:
+        # Token layout: version (1) | timestamp (8) | IV (16) | ciphertext | HMAC (32)
+        data = base64.urlsafe_b64decode(encrypted_text)
+        if len(data) < 73 or data[0] != 0x80:
+            raise InvalidToken
+        mac = token_hmac.copy()
+        mac.update(data[:-32])
+        if not hmac.compare_digest(mac.digest(), data[-32:]):
+            raise InvalidToken
+        decryptor = Cipher(algorithms.AES(encryption_key), modes.CBC(data[9:25])).decryptor()
+        padded = decryptor.update(data[25:-32]) + decryptor.finalize()
+        unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
+        return (unpadder.update(padded) + unpadder.finalize()).decode()
+    except ValueError:
+        raise InvalidToken
+
+def create_session(proxies=None):
+    """Create a pooled HTTP session so requests reuse keep-alive connections"""
+    session = requests.Session()
+    # urllib3 only retries failed connects, quickly; statuses and read errors are left
+    # to retry_api, which signs a fresh query and goes through the rate limiter again
+    retries = Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.5)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS, max_retries=retries)
+    session.mount("https://", adapter)
+    session.proxies = proxies or {}
+    return session
 
 def validate_environment():
     required_vars = ['GCP_CREDENTIALS_PATH', 'ENCRYPTION_KEY', 'SHEET_ID']
@@ -34,6 +109,20 @@ def validate_environment():
     if not os.path.exists(os.getenv('GCP_CREDENTIALS_PATH')):
         raise FileNotFoundError(f"GCP credentials not found at {os.getenv('GCP_CREDENTIALS_PATH')}")
 
+def retry_delay(error, default):
+    """Return seconds to wait before retrying, or None if the error is not retriable"""
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    if status in NON_RETRIABLE_STATUS:
+        return None
+    if status in RETRIABLE_STATUS:
+        retry_after = response.headers.get("Retry-After")
+        try:
+            return float(retry_after)
+        except (TypeError, ValueError):
+            pass  # Missing or HTTP-date form, fall back to backoff
+    return default
+
 def retry_api(max_retries=MAX_API_RETRIES, initial_delay=INITIAL_RETRY_DELAY):
     def decorator(func):
         @wraps(func)
@@ -43,36 +132,135 @@ def retry_api(max_retries=MAX_API_RETRIES, initial_delay=INITIAL_RETRY_DELAY):
             while retries <= max_retries:
                 try:
                     return func(*args, **kwargs)
-                except (requests.exceptions.RequestException, gspread.exceptions.APIError) as e:
+                except requests.exceptions.RequestException as e:
                     retries += 1
                     last_exception = e
                     if retries > max_retries:
                         logging.error(f"Max retries reached for {func.__name__}")
                         raise e
-                    delay = initial_delay * (BACKOFF_FACTOR ** (retries - 1))
+                    backoff = initial_delay * (BACKOFF_FACTOR ** (retries - 1)) * random.uniform(0.8, 1.2)
+                    delay = retry_delay(e, backoff)
+                    if delay is None:
+                        raise e
                     logging.warning(f"Retrying {func.__name__} in {delay:.1f}s after error: {e}")
-                    time.sleep(delay * random.uniform(0.8, 1.2))
+                    time.sleep(delay)
             raise last_exception
         return wrapper
     return decorator
 
+class RateLimiter:
+    """Token bucket shared by all worker threads, refilled by a timer thread"""
+    def __init__(self, rate, capacity=None):
+        self._interval = 1.0 / rate
+        self._tokens = threading.BoundedSemaphore(capacity or rate)
+        threading.Thread(target=self._refill, daemon=True).start()
+
+    def _refill(self):
+        while True:
+            time.sleep(self._interval)
+            try:
+                self._tokens.release()
+            except ValueError:
+                pass  # Bucket is already full
+
+    def acquire(self):
+        """Block until a request slot is available"""
+        self._tokens.acquire()
+
+RATE_LIMITER = RateLimiter(RATE_LIMIT_PER_SEC)
+
+class BalanceCache:
+    """On-disk cache of balance results that survives between runs; a ttl of 0 disables it"""
+    def __init__(self, path, ttl):
+        self.ttl = ttl
+        self._db = None
+        self._lock = threading.Lock()
+        if ttl > 0:
+            try:
+                self._db = shelve.open(path)
+            except (OSError, *dbm.error) as e:
+                # The cache only saves calls between runs, so carry on without it
+                logging.warning(f"Balance cache unavailable, continuing without it: {e}")
+
+    @staticmethod
+    def make_key(api_key, endpoint):
+        """Build a cache key that never contains the raw API key"""
+        return f"{hashlib.sha256(api_key.encode()).hexdigest()[:16]}:{endpoint}"
+
+    def get(self, key):
+        """Return the cached value if it is still fresh, otherwise None; expired entries are dropped"""
+        with self._lock:
+            try:
+                entry = self._db.get(key)
+                if entry is None:
+                    return None
+                if time.time() - entry[0] < self.ttl:
+                    return entry[1]
+                del self._db[key]
+            except Exception as e:  # e.g. a truncated entry that no longer unpickles
+                logging.warning(f"Balance cache read failed for {key}: {e}")
+        return None
+
+    def set(self, key, value):
+        with self._lock:
+            try:
+                self._db[key] = (time.time(), value)
+            except Exception as e:
+                logging.warning(f"Balance cache write failed for {key}: {e}")
+
+    def fetch(self, key, func, *args):
+        """Return the cached value for key while it is fresh, otherwise call func and cache its result"""
+        if self._db is None:
+            return func(*args)
+        value = self.get(key)
+        if value is None:
+            value = func(*args)
+            self.set(key, value)
+        return value
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+
+def load_cached_coin_list(cache_id):
+    """Return the locally cached coin list if it is fresh, otherwise None"""
+    try:
+        if time.time() - os.path.getmtime(COIN_LIST_CACHE_PATH) < COIN_LIST_CACHE_TTL:
+            with open(COIN_LIST_CACHE_PATH, "rb") as f:
+                cached = orjson.loads(f.read())
+            # Anything but the shape save_coin_list writes is ignored
+            if isinstance(cached, dict) and cached.get("id") == cache_id:
+                coins = cached.get("coins")
+                if isinstance(coins, list) and all(isinstance(coin, str) for coin in coins):
+                    return coins
+    except (OSError, ValueError):
+        pass  # Missing or unreadable cache, fall through to the sheet
+    return None
+
+def save_coin_list(cache_id, coin_list):
+    try:
+        with open(COIN_LIST_CACHE_PATH, "w") as f:
+            json.dump({"id": cache_id, "coins": coin_list}, f)
+    except OSError as e:
+        logging.warning(f"Could not cache coin list: {e}")
+
 @retry_api()
-def fetch_spot_prices(coin_list, proxies=None):
+def fetch_spot_prices(coin_list, session):
     prices = {"USDT": 1.0, "USDC": 1.0}
     try:
-        response = requests.get(
+        response = session.get(
             f"{BASE_URL}/v5/market/tickers",
             params={"category": "spot"},
-            proxies=proxies,
             timeout=10
         )
         response.raise_for_status()
-        tickers = response.json()["result"]["list"]
+        tickers = orjson.loads(response.content)["result"]["list"]
+        ticker_map = {item["symbol"]: item for item in tickers}
         for coin in coin_list:
             if coin in prices:
                 continue
-            symbol = f"{coin}USDT"
-            price_entry = next((item for item in tickers if item["symbol"] == symbol), None)
+            price_entry = ticker_map.get(f"{coin}USDT")
             if price_entry:
                 prices[coin] = float(price_entry["lastPrice"])
             else:
@@ -86,7 +274,8 @@ def fetch_spot_prices(coin_list, proxies=None):
     return prices
 
 @retry_api()
-def get_subaccount_balances(api_key, api_secret, member_id, coins, proxies=None):
+def get_subaccount_balances(session, api_key, signer, member_id, coins):
+    RATE_LIMITER.acquire()
     timestamp = str(int(time.time() * 1000))
     coin_param = ",".join(coins)
 
@@ -100,54 +289,116 @@ def get_subaccount_balances(api_key, api_secret, member_id, coins, proxies=None)
     if member_id:
         params["memberId"] = member_id
 
-    param_str = "&".join(f"{k}={v}" for k, v in sorted(params.items()))
-    signature = hmac.new(api_secret.encode(), param_str.encode(), hashlib.sha256).hexdigest()
-    params["sign"] = signature
+    param_str = "&".join([f"{k}={params[k]}" for k in SIGNED_PARAM_ORDER if k in params])
+    mac = signer.copy()
+    mac.update(param_str.encode())
+    params["sign"] = mac.hexdigest()
 
-    response = requests.get(
+    response = session.get(
         f"{BASE_URL}/v5/asset/transfer/query-account-coins-balance",
         params=params,
-        proxies=proxies,
         timeout=10
     )
     response.raise_for_status()
-    data = response.json()
+    data = orjson.loads(response.content)
     if data["retCode"] != 0:
         raise ValueError(f"API error: {data['retMsg']}")
     return data["result"]["balance"]
 
 def calculate_total_value(balances, prices):
-    total = 0.0
-    for asset in balances:
-        coin = asset["coin"]
-        amount = float(asset.get("walletBalance", 0))
-        price = prices.get(coin, 0.0)
-        total += amount * price
-    return total
+    amounts = [float(asset.get("walletBalance", 0)) for asset in balances]
+    coin_prices = [prices.get(asset["coin"], 0.0) for asset in balances]
+    return sum(map(operator.mul, amounts, coin_prices))
+
+def sheet_range(sheet_name, a1_range):
+    """Qualify an A1 range with its worksheet name"""
+    return "'{}'!{}".format(sheet_name.replace("'", "''"), a1_range)
+
+@retry_api()
+def read_ranges(sheets, sheet_id, ranges):
+    """Read several ranges in one values.batchGet call"""
+    response = sheets.get(
+        f"{SHEETS_URL}/{sheet_id}/values:batchGet",
+        params={"ranges": ranges, "valueRenderOption": "UNFORMATTED_VALUE"},
+        timeout=30
+    )
+    response.raise_for_status()
+    return [value_range.get("values", []) for value_range in orjson.loads(response.content)["valueRanges"]]
 
 @retry_api(max_retries=2, initial_delay=3)
-def update_sheet(sheet, row_index, value):
-    sheet.update(range_name=f"A{row_index}", values=[[round(value, 2)]])
+def update_sheet(sheets, sheet_id, updates):
+    response = sheets.post(
+        f"{SHEETS_URL}/{sheet_id}/values:batchUpdate",
+        json={"valueInputOption": "RAW", "data": updates},
+        timeout=30
+    )
+    response.raise_for_status()
+
+def decrypt_credentials(row_index, row):
+    """Decrypt a row's API key and secret, returning None for rows to skip"""
+    try:
+        # Trailing empty cells are trimmed from the range response
+        api_key_encrypted = row[1] if len(row) > 1 else ""
+        api_secret_encrypted = row[2] if len(row) > 2 else ""
+
+        if not api_key_encrypted or not api_secret_encrypted:
+            logging.info(f"Skipping row {row_index} (missing API credentials)")
+            return None
+
+        return decrypt(api_key_encrypted), decrypt(api_secret_encrypted)
+
+    except Exception as e:
+        logging.error(f"Row {row_index} failed to decrypt", exc_info=True)
+        return None
+
+def process_row(session, cache, row_index, row, api_key, api_secret, coin_list, price_cache):
+    try:
+        # Keyed once per row; each signature (including retries) copies it
+        signer = hmac.new(api_secret.encode(), digestmod="sha256")
+
+        member_id = str(row[4]).strip() if len(row) > 4 else ""
+        target_type = f"subaccount ({member_id})" if member_id else "main account"
+
+        balances = cache.fetch(
+            BalanceCache.make_key(api_key, f"bybit:{member_id}:{','.join(coin_list)}"),
+            get_subaccount_balances, session, api_key, signer, member_id or None, coin_list
+        )
+        nav = calculate_total_value(balances, price_cache)
+
+        logging.info(f"Processed row {row_index} ({target_type}): {_fmt(nav)}")
+        return row_index, nav
+
+    except Exception as e:
+        logging.error("Script failed", exc_info=True)
 
 def main():
     try:
         validate_environment()
 
         # Initialize clients
-        SCOPES = [
-            "https://www.googleapis.com/auth/spreadsheets",
-            "https://www.googleapis.com/auth/drive"
-        ]
+        SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
         
         creds = Credentials.from_service_account_file(
             os.getenv("GCP_CREDENTIALS_PATH"),
             scopes=SCOPES
         )
-        sheet = gspread.authorize(creds).open_by_key(os.getenv("SHEET_ID")).worksheet(os.getenv("SHEET_NAME", "Sheet2"))
-        rows = sheet.get_all_values()
+        sheet_name = os.getenv("SHEET_NAME", "Sheet2")
+        sheet_id = os.getenv("SHEET_ID")
+        # Talk to the Sheets REST API directly; no spreadsheet metadata is fetched
+        sheets = AuthorizedSession(creds)
 
-        coin_cell = sheet.acell("H1").value
-        coin_list = json.loads(coin_cell)
+        # Credentials live in B and C, member ID in E; the H1 coin list rides
+        # along in the same batchGet unless the local copy is still fresh
+        coin_cache_id = f"{sheet_id}!{sheet_name}"
+        coin_list = load_cached_coin_list(coin_cache_id)
+        ranges = [sheet_range(sheet_name, "A1:E")]
+        if coin_list is None:
+            ranges.append(sheet_range(sheet_name, "H1"))
+        value_ranges = read_ranges(sheets, sheet_id, ranges)
+        rows = value_ranges[0]
+        if coin_list is None:
+            coin_list = orjson.loads(value_ranges[1][0][0])
+            save_coin_list(coin_cache_id, coin_list)
         logging.info(f"Using coins: {coin_list}")
 
         proxies = {
@@ -156,34 +407,49 @@ def main():
         }
         proxies = {k: v for k, v in proxies.items() if v}
 
-        price_cache = fetch_spot_prices(coin_list, proxies)
-
-        dec_key = os.getenv("ENCRYPTION_KEY").encode()
-
-        for row_index, row in enumerate(rows[1:], start=2):
-            try:
-                api_key_encrypted = row[1]
-                api_secret_encrypted = row[2]
-
-                if not api_key_encrypted or not api_secret_encrypted:
-                    logging.info(f"Skipping row {row_index} (missing API credentials)")
-                    continue
+        with create_session(proxies) as session:
+            price_cache = fetch_spot_prices(coin_list, session)
 
-                api_key = decrypt(api_key_encrypted, dec_key)
-                api_secret = decrypt(api_secret_encrypted, dec_key)
+            load_cipher(os.getenv("ENCRYPTION_KEY").encode())
 
-                member_id = row[4].strip() if len(row) > 4 else ""
-                target_type = f"subaccount ({member_id})" if member_id else "main account"
+            # Rows repeating the same credentials and member ID are fetched once
+            # and the result is copied to each of them
+            groups = {}
+            for row_index, row in enumerate(rows[1:], start=2):
+                member_id = str(row[4]).strip() if len(row) > 4 else ""
+                groups.setdefault((*row[1:3], member_id), []).append(row_index)
+            if len(groups) < len(rows) - 1:
+                logging.info(f"{len(rows) - 1 - len(groups)} duplicate rows will reuse earlier results")
 
-                balances = get_subaccount_balances(api_key, api_secret, member_id or None, coin_list, proxies)
-                nav = calculate_total_value(balances, price_cache)
+            # Decrypt every unique account up front so the workers only wait on the network
+            accounts = [
+                (row_indices, rows[row_indices[0] - 1], decrypt_credentials(row_indices[0], rows[row_indices[0] - 1]))
+                for row_indices in groups.values()
+            ]
 
-                update_sheet(sheet, row_index, nav)
-                logging.info(f"Processed row {row_index} ({target_type}): ${nav:,.2f}")
-                time.sleep(1)
+            results = {}
+            with closing(BalanceCache(BALANCE_CACHE_PATH, BALANCE_CACHE_TTL)) as cache, \
+                    ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                jobs = {
+                    executor.submit(process_row, session, cache, row_indices[0], row, *keys, coin_list, price_cache): row_indices
+                    for row_indices, row, keys in accounts
+                    if keys is not None
+                }
+                for job in as_completed(jobs):
+                    result = job.result()
+                    if result is None:
+                        continue
+                    _, nav = result
+                    for row_index in jobs[job]:
+                        results[row_index] = round(nav, 2)
 
-            except Exception as e:
-                logging.error("Script failed", exc_info=True)
+        if results:
+            # One contiguous range; None cells are skipped by the Sheets API,
+            # so skipped or failed rows keep their previous values
+            last_row = max(results)
+            values = [[results.get(i)] for i in range(2, last_row + 1)]
+            update_sheet(sheets, sheet_id, [{'range': sheet_range(sheet_name, f"A2:A{last_row}"), 'values': values}])
+            logging.info(f"Updated {len(results)} rows in one batch")
 
     except Exception as e:
         logging.error(f"Fatal error: {e}")